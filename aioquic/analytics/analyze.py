@@ -1,15 +1,40 @@
 import argparse
+import gzip
 import json
 import logging
 import os
-from typing import TypedDict, List, Dict, Any
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import TypedDict, List, Dict, Any, Optional
 
 import pandas as pd
 
 from aioquic.quic.logger import QuicLoggerTrace
 
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pa_parquet
+except ImportError:
+    pa = None
+
 logger = logging.getLogger()
 
+# bump whenever the layout or meaning of the output columns changes, so that
+# parquet outputs written by an older analyzer are not reused as a cache
+OUTPUT_VERSION = "1"
+
 class QlogDict(TypedDict):
     qlog_format: str
     qlog_version: str
@@ -17,83 +42,139 @@ class QlogDict(TypedDict):
 
 
 class QLogAnalyzer():
-    def __init__(self, log_path: str):
+    def __init__(
+        self,
+        log_path: str,
+        output_format: Optional[str] = None,
+        stream: bool = False,
+        use_cache: bool = True,
+    ):
+        if output_format is None:
+            output_format = "parquet" if pa is not None else "csv"
+        elif output_format == "parquet" and pa is None:
+            raise Exception("parquet output requires pyarrow")
+
         self.log_path: str = log_path
+        self.output_format: str = output_format
+        if stream and ijson is None:
+            logger.warning(
+                "ijson is not installed, loading %s into memory instead of streaming",
+                log_path,
+            )
+        self.stream: bool = stream and ijson is not None
+        self.use_cache: bool = use_cache
         self.log_id: str = ""
+        stem = log_path or ""
+        if stem.endswith(".gz"):
+            stem = stem[:-3]
+        self._base_target: str = os.path.splitext(stem)[0]
         self.log_data: QlogDict = None
+        self._results: dict = None
         self._read_log_file()
 
-    def analyze_cwnd(self) -> list[dict]:
-        cwnd_data = []
-        for trace in self.log_data.get("traces", []):
-            for event in trace["events"]:
-                if event["name"] == "recovery:metrics_updated":
-                    cwnd_data.append({
-                        "cwnd": event["data"]["cwnd"],
-                        "bytes_in_flight": event["data"]["bytes_in_flight"],
-                        "time": event["time"]
-                    })
-
-        self._save_to_csv("cwnd", cwnd_data)
-        return cwnd_data
-    
-    def analyze_rtt(self) -> list[dict]:
-        rtt_data = []
-        for trace in self.log_data.get("traces", []):
-            for event in trace["events"]:
-                if event["name"] == "recovery:metrics_updated":
-                    data = event["data"]
-                    rtt_data.append({
-                        "time": event["time"],
-                        "min_rtt":     data.get("min_rtt"),
-                        "smoothed_rtt": data.get("smoothed_rtt"),
-                        "latest_rtt":   data.get("latest_rtt"),
-                        "rtt_variance": data.get("rtt_variance"),
-                    })
-
-        self._save_to_csv("rtt", rtt_data)
-        return rtt_data
-    
-    def analyze_loss(self) -> list[dict]:
-        loss_events = [] 
-        for trace in self.log_data.get("traces", []):
-            for event in trace["events"]:
-                if event["name"] == "recovery:packet_lost":
-                    data = event["data"]
-                    loss_events.append({
-                        "time": event["time"],
-                        "packet_number": data.get("packet_number"),
-                        "packet_type": data.get("packet_type"),
-                        "trigger": data.get("trigger"),
-                    })
-
-        self._save_to_csv("loss", loss_events)
-        return loss_events
-    
-    def analyze_goodput(self):
+    def analyze_all(self) -> dict:
+        # single pass over all events; cached so the analyze_* helpers share it
+        if self._results is not None:
+            return self._results
+
+        cwnd_data = {"cwnd": [], "bytes_in_flight": [], "time": []}
+        rtt_data = {
+            "time": [],
+            "min_rtt": [],
+            "smoothed_rtt": [],
+            "latest_rtt": [],
+            "rtt_variance": [],
+        }
+        loss_events = {
+            "time": [],
+            "packet_number": [],
+            "packet_type": [],
+            "trigger": [],
+        }
         total_bytes = 0
         t_first = None
         t_last = None
 
-        for trace in self.log_data["traces"]:
-            for ev in trace["events"]:
-                t = ev["time"]
+        def handle_metrics(event):
+            data = event["data"]
+            t = event["time"]
+            cwnd_data["cwnd"].append(data["cwnd"])
+            cwnd_data["bytes_in_flight"].append(data["bytes_in_flight"])
+            cwnd_data["time"].append(t)
+            rtt_data["time"].append(t)
+            rtt_data["min_rtt"].append(data.get("min_rtt"))
+            rtt_data["smoothed_rtt"].append(data.get("smoothed_rtt"))
+            rtt_data["latest_rtt"].append(data.get("latest_rtt"))
+            rtt_data["rtt_variance"].append(data.get("rtt_variance"))
+
+        def handle_loss(event):
+            data = event["data"]
+            loss_events["time"].append(event["time"])
+            loss_events["packet_number"].append(data.get("packet_number"))
+            loss_events["packet_type"].append(data.get("packet_type"))
+            loss_events["trigger"].append(data.get("trigger"))
+
+        def handle_http(event):
+            nonlocal total_bytes
+            frame = event["data"].get("frame", {})
+            if frame.get("frame_type") == "data":
+                total_bytes += event["data"].get("length", 0)
+
+        handlers = {
+            "recovery:metrics_updated": handle_metrics,
+            "recovery:packet_lost": handle_loss,
+            "http:frame_parsed": handle_http,
+        }
+
+        for event in self._iter_events():
+            t = event["time"]
 
-                # keep track of active duration
-                if t_first is None:
-                    t_first = t
-                t_last = t
+            # keep track of active duration
+            if t_first is None:
+                t_first = t
+            t_last = t
+
+            handler = handlers.get(event["name"])
+            if handler is not None:
+                handler(event)
+
+        goodput = self._compute_goodput(total_bytes, t_first, t_last)
+
+        self._save("cwnd", cwnd_data)
+        self._save("rtt", rtt_data)
+        self._save("loss", loss_events)
+        self._save("goodput", {key: [value] for key, value in goodput.items()})
+
+        self._results = {
+            "cwnd": cwnd_data,
+            "rtt": rtt_data,
+            "loss": loss_events,
+            "goodput": goodput,
+        }
+        return self._results
 
-                if ev["name"] == "http:frame_parsed":
-                    frame = ev["data"].get("frame", {})
-                    if frame.get("frame_type") == "data":
-                        total_bytes += ev["data"].get("length", 0)
+    def analyze_cwnd(self) -> dict[str, list]:
+        return self.analyze_all()["cwnd"]
+    
+    def analyze_rtt(self) -> dict[str, list]:
+        return self.analyze_all()["rtt"]
+    
+    def analyze_loss(self) -> dict[str, list]:
+        return self.analyze_all()["loss"]
+    
+    def analyze_goodput(self):
+        return self.analyze_all()["goodput"]
 
+    def _compute_goodput(self, total_bytes, t_first, t_last):
         if t_first is None or t_last is None:
             return {"bytes": 0, "duration": 0.0, "goodput_mbps": 0.0}
 
         duration_sec = (t_last - t_first) / 1000.0  # qlog time is in ms
-        goodput_mbps = (total_bytes * 8) / (duration_sec * 1e6)
+        if duration_sec <= 0:
+            # a single event, or all events in the same millisecond
+            goodput_mbps = 0.0
+        else:
+            goodput_mbps = (total_bytes * 8) / (duration_sec * 1e6)
 
         return {
             "bytes": total_bytes,
@@ -102,31 +183,194 @@ class QLogAnalyzer():
         }
 
 
+    def _iter_events(self):
+        if self.stream:
+            with self._open_log_file() as f:
+                yield from ijson.items(f, "traces.item.events.item", use_float=True)
+        else:
+            for trace in self.log_data.get("traces", []):
+                yield from trace["events"]
+
     def _read_log_file(self):
         if not self.log_path:
             raise Exception("log_path is None")
+
+        if self.use_cache and self._load_cached_results():
+            return
+
+        if self.stream:
+            # events are pulled from disk one at a time by _iter_events
+            return
         
-        with open(self.log_path, "r", encoding="utf-8") as f:
-            self.log_data = json.load(f)
+        with self._open_log_file() as f:
+            if orjson is not None:
+                self.log_data = orjson.loads(f.read())
+            else:
+                self.log_data = json.load(f)
+
+    def _open_log_file(self):
+        if self.log_path.endswith(".gz"):
+            return gzip.open(self.log_path, "rb")
+        return open(self.log_path, "rb")
     
-    def _save_to_csv(self, keyword, data: list[dict]):
-        directory, filename = os.path.split(self.log_path)
+    def _load_cached_results(self) -> bool:
+        # reuse the parquet outputs of an earlier run if none is older than the qlog
+        if self.output_format != "parquet":
+            return False
+
+        paths = {
+            keyword: self._target_path(keyword, "parquet")
+            for keyword in ("cwnd", "rtt", "loss", "goodput")
+        }
+        try:
+            log_mtime = os.path.getmtime(self.log_path)
+            if any(os.path.getmtime(path) < log_mtime for path in paths.values()):
+                return False
+        except FileNotFoundError:
+            return False
+
+        # x_log.json and x_log.json.gz share their output paths, so also check
+        # which qlog (and analyzer version) the outputs were produced from
+        expected = self._output_metadata()
+        try:
+            for path in paths.values():
+                metadata = pa_parquet.read_schema(path).metadata or {}
+                if any(metadata.get(key) != value for key, value in expected.items()):
+                    return False
+
+            results = {
+                keyword: pa_parquet.read_table(path).to_pydict()
+                for keyword, path in paths.items()
+            }
+        except (pa.ArrowInvalid, OSError):
+            # truncated or otherwise unreadable output, parse the qlog again
+            return False
+        results["goodput"] = {
+            key: values[0] for key, values in results["goodput"].items()
+        }
+        self._results = results
+        return True
+
+    def _output_metadata(self) -> dict[bytes, bytes]:
+        return {
+            b"qlog_source": os.path.abspath(self.log_path).encode(),
+            b"analyzer_version": OUTPUT_VERSION.encode(),
+        }
+
+    def _target_path(self, keyword, extension):
+        return f"{self._base_target}_{keyword}.{extension}"
+
+    def _save(self, keyword, data: dict[str, list]):
+        if self.output_format == "csv":
+            self._save_to_csv(keyword, data)
+        else:
+            self._save_to_parquet(keyword, data)
+
+    def _save_to_csv(self, keyword, data: dict[str, list]):
+        target_path = self._target_path(keyword, "csv")
+
+        if pa is not None:
+            write = partial(pa_csv.write_csv, pa.table(data))
+        else:
+            write = partial(pd.DataFrame(data).to_csv, index=False)
+        self._write_atomically(target_path, write)
+
+    def _save_to_parquet(self, keyword, data: dict[str, list]):
+        target_path = self._target_path(keyword, "parquet")
+        table = pa.table(data, metadata=self._output_metadata())
+        write = partial(
+            pa_parquet.write_table, table, compression="zstd", use_dictionary=True
+        )
+        self._write_atomically(target_path, write)
+
+    def _write_atomically(self, target_path, write):
+        # an interrupted run must not leave a partial file that looks like a
+        # fresh cache entry, and concurrent writers must not interleave
+        tmp_path = f"{target_path}.{os.getpid()}.tmp"
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, target_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
 
-        target_path = f"{directory}/{filename[:-5]}_{keyword}.csv"
 
-        df = pd.DataFrame(data)
-        df.to_csv(target_path, index=False)
+def analyze_file(
+    log_path: str,
+    output_format: Optional[str] = None,
+    stream: bool = False,
+    use_cache: bool = True,
+):
+    QLogAnalyzer(
+        log_path, output_format=output_format, stream=stream, use_cache=use_cache
+    ).analyze_all()
 
 
 def main():
     parser = argparse.ArgumentParser(description="Process a file path.")
-    parser.add_argument("filepath", type=str, help="Path to the input file")
+    parser.add_argument(
+        "filepaths", type=str, nargs="+", help="Path to the input file(s)"
+    )
+    parser.add_argument(
+        "--format",
+        type=str,
+        choices=["parquet", "csv"],
+        default=None,
+        help="output format for the extracted metrics "
+        "(default: parquet if pyarrow is installed, else csv)",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="stream events from disk with ijson instead of loading the whole file",
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="use_cache",
+        action="store_false",
+        help="re-parse the qlog even if up-to-date parquet outputs exist",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of qlog files to analyze in parallel",
+    )
 
     args = parser.parse_args()
 
-    qla = QLogAnalyzer(args.filepath)
+    worker = partial(
+        analyze_file,
+        output_format=args.format,
+        stream=args.stream,
+        use_cache=args.use_cache,
+    )
+    # a bad qlog is reported and skipped so it does not abort the whole batch
+    failed = 0
+    if args.jobs <= 1 or len(args.filepaths) == 1:
+        for filepath in args.filepaths:
+            try:
+                worker(filepath)
+            except Exception:
+                logger.exception("Failed to analyze %s", filepath)
+                failed += 1
+    else:
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            futures = {
+                filepath: executor.submit(worker, filepath)
+                for filepath in args.filepaths
+            }
+            for filepath, future in futures.items():
+                try:
+                    future.result()
+                except Exception:
+                    logger.exception("Failed to analyze %s", filepath)
+                    failed += 1
 
-    qla.analyze_cwnd()
+    if failed:
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
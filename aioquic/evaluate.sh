@@ -11,6 +11,12 @@ COMMON_CLIENT_ARGS="--load-rps 100 --load-duration ${DURATION} --insecure"
 LOG_DIR="pkt_logs/$(date +'%Y-%m-%d_%H-%M-%S')"
 mkdir -p "$LOG_DIR"
 
+# Set QLOG_GZIP=1 to have the client write gzip-compressed qlogs.
+QLOG_SUFFIX=".json"
+if [[ "${QLOG_GZIP:-0}" == "1" ]]; then
+    QLOG_SUFFIX=".json.gz"
+fi
+
 if command -v sudo >/dev/null 2>&1; then
     SUDO=sudo
 else
@@ -22,6 +28,19 @@ reset_qdisc() {
     $SUDO tc qdisc del dev lo root 2>/dev/null || true
 }
 
+# Install netem (and the optional TBF child) with a single tc process.
+apply_qdisc() {
+    local netem_args="$1"
+    local rate="$2"
+
+    {
+        echo "qdisc add dev lo root handle 1: netem ${netem_args}"
+        if [[ -n "${rate}" ]]; then
+            echo "qdisc add dev lo parent 1:1 handle 2: tbf rate ${rate} burst 32kbit latency 400ms"
+        fi
+    } | $SUDO tc -batch -
+}
+
 run_experiment() {
     local id="$1"
     local label="$2"
@@ -39,20 +58,17 @@ run_experiment() {
         echo "  [tc] Baseline: no shaping"
     else
         echo "  [tc] Adding netem (${netem_args})"
-        $SUDO tc qdisc add dev lo root handle 1: netem ${netem_args}
-
         if [[ -n "${rate}" ]]; then
             echo "  [tc] Adding TBF rate limit (${rate})"
-            $SUDO tc qdisc add dev lo parent 1:1 handle 2: tbf \
-                rate "${rate}" burst 32kbit latency 400ms
         fi
+        apply_qdisc "${netem_args}" "${rate}"
 
         echo "  [tc] Current qdisc:"
         tc qdisc show dev lo
     fi
 
     ts=$(date +"%Y%m%d-%H%M%S")
-    qlog_name="EX_${id}_client_${ts}_log.json"
+    qlog_name="EX_${id}_client_${ts}_log${QLOG_SUFFIX}"
     qlog_path="${LOG_DIR}/${qlog_name}"
 
     echo "  [client] Starting client, qlog -> ${qlog_path}"
@@ -63,8 +79,7 @@ run_experiment() {
 
     echo "  [client] Done. qlog stored."
 
-    # reset so next experiment starts clean
-    reset_qdisc
+    # the next experiment (or the final cleanup below) resets the qdisc
 }
 
 ### Define experiments here ###
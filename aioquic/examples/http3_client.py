@@ -1,5 +1,6 @@
 import argparse
 import asyncio
+import gzip
 import json
 import logging
 import os
@@ -29,6 +30,11 @@ from aioquic.quic.logger import QuicFileLogger, QuicLogger
 from aioquic.quic.packet import QuicProtocolVersion
 from aioquic.tls import CipherSuite, SessionTicket
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 try:
     import uvloop
 except ImportError:
@@ -48,8 +54,16 @@ def qlog_filename():
 
 def write_qlog():
     print("Writing qlog...")
-    with open(args.qlog_filename, "w") as f:
-        json.dump(ql.to_dict(), f)
+    if orjson is not None:
+        data = orjson.dumps(ql.to_dict())
+    else:
+        data = json.dumps(ql.to_dict()).encode()
+    if args.qlog_filename.endswith(".gz"):
+        f = gzip.open(args.qlog_filename, "wb", compresslevel=6)
+    else:
+        f = open(args.qlog_filename, "wb")
+    with f:
+        f.write(data)
     print("qlog written.")
 
 class URL:
@@ -268,6 +282,7 @@ async def perform_http_request(
     data: Optional[str],
     include: bool,
     output_dir: Optional[str],
+    log_level: int = logging.INFO,
 ) -> None:
     # perform request
     start = time.time()
@@ -292,9 +307,14 @@ async def perform_http_request(
     for http_event in http_events:
         if isinstance(http_event, DataReceived):
             octets += len(http_event.data)
-    logger.info(
-        "Response received for %s %s : %d bytes in %.1f s (%.3f Mbps)"
-        % (method, urlparse(url).path, octets, elapsed, octets * 8 / elapsed / 1000000)
+    logger.log(
+        log_level,
+        "Response received for %s %s : %d bytes in %.1f s (%.3f Mbps)",
+        method,
+        urlparse(url).path,
+        octets,
+        elapsed,
+        octets * 8 / elapsed / 1000000,
     )
 
     # output response
@@ -320,11 +340,12 @@ async def generate_load(
     Fire HTTP requests at roughly `rps` for `duration` seconds.
     """
     interval = 1.0 / rps
+    count = round(rps * duration)
     loop = asyncio.get_running_loop()
-    end_time = loop.time() + duration
+    start_time = loop.time()
     pending = []
 
-    while loop.time() < end_time:
+    for k in range(count):
         # fire one request (you can also randomize data/path if you want)
         coro = perform_http_request(
             client=client,
@@ -332,15 +353,29 @@ async def generate_load(
             data=data,
             include=include,
             output_dir=output_dir,
+            log_level=logging.DEBUG,
         )
         # run it concurrently so we can maintain rate even if responses are slow
         pending.append(asyncio.create_task(coro))
 
-        await asyncio.sleep(interval)
+        # sleep until the next slot rather than a fixed interval, so time spent
+        # issuing requests does not drift the rate; if we are behind schedule the
+        # missed requests go out back to back before the next sleep
+        delay = start_time + (k + 1) * interval - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
 
     # wait for all outstanding requests to finish
-    if pending:
-        await asyncio.gather(*pending, return_exceptions=True)
+    results = await asyncio.gather(*pending, return_exceptions=True)
+
+    # per-request lines are only logged with --verbose, summarise the run instead
+    failed = sum(1 for result in results if isinstance(result, BaseException))
+    logger.info(
+        "Load finished: %d requests sent, %d failed in %.1f s",
+        len(results),
+        failed,
+        loop.time() - start_time,
+    )
 
 
 def process_http_pushes(
@@ -627,7 +662,7 @@ if __name__ == "__main__":
         "--qlog-filename",
         type=str,
         default=qlog_filename(),
-        help="filename to store the qlog dump",
+        help="filename to store the qlog dump (gzip-compressed if it ends in .gz)",
     )
 
     args = parser.parse_args()